@@ -3,28 +3,40 @@
 Main entry point for the Agentic Document Extraction System
 """
 
+import argparse
 import subprocess
 import sys
 import os
+import importlib.util
+import socket
+import threading
+import time
+import urllib.request
+from functools import lru_cache
+
+REQUIRED_MODULES = ["streamlit", "openai", "pytesseract", "PIL", "cv2", "pdf2image"]
+STREAMLIT_PORT = 8501
+
+@lru_cache(maxsize=None)
+def get_tesseract_version():
+    """Return the Tesseract version, running `tesseract --version` only once per process"""
+    import pytesseract
+    return pytesseract.get_tesseract_version()
 
 def check_dependencies():
     """Check if required dependencies are installed"""
-    try:
-        import streamlit
-        import openai
-        import pytesseract
-        import PIL
-        import cv2
-        print("✅ All Python dependencies are installed")
-    except ImportError as e:
-        print(f"❌ Missing Python dependency: {e}")
+    # find_spec locates modules without executing them, so heavy packages
+    # like cv2 and streamlit are not imported just to be checked
+    missing = [name for name in REQUIRED_MODULES if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"❌ Missing Python dependency: {', '.join(missing)}")
         print("Please run: pip install -r requirements.txt")
         return False
+    print("✅ All Python dependencies are installed")
     
     # Check Tesseract
     try:
-        import pytesseract
-        pytesseract.get_tesseract_version()
+        get_tesseract_version()
         print("✅ Tesseract OCR is installed")
     except Exception as e:
         print(f"❌ Tesseract OCR not found: {e}")
@@ -36,8 +48,80 @@ def check_dependencies():
     
     return True
 
+def wait_for_port(port, timeout=30.0):
+    """Wait until something accepts connections on localhost:port"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def run_headless_session(port, query_string="", timeout=120.0):
+    """
+    Run the app script once inside the server, the way an opened browser tab does
+    
+    Connects to Streamlit's websocket and requests a script run, so the server
+    imports the app and fills its caches. Returns False when the websocket
+    client or the Streamlit protocol classes aren't available, or the run fails.
+    """
+    try:
+        from websockets.sync.client import connect
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    except ImportError:
+        return False
+    
+    try:
+        with connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"],
+                     open_timeout=5, max_size=None) as websocket:
+            request = BackMsg()
+            request.rerun_script.query_string = query_string
+            websocket.send(request.SerializeToString())
+            
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                message = ForwardMsg()
+                message.ParseFromString(websocket.recv(timeout=deadline - time.monotonic()))
+                if message.WhichOneof("type") == "script_finished":
+                    return True
+    except Exception:
+        pass
+    return False
+
+def prewarm(port=STREAMLIT_PORT):
+    """Warm the server and OCR engine so the first user request doesn't pay cold-start costs"""
+    if not wait_for_port(port):
+        return
+    
+    # A real script run in the server: imports the app, and ?prewarm=1 makes it build the
+    # cached DocumentProcessor (OpenAI SDK, OpenCV, OCR) before the first user clicks
+    if not run_headless_session(port, "prewarm=1"):
+        # Without a websocket client, at least load the static assets
+        for path in ("/_stcore/health", "/"):
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5).read()
+            except Exception:
+                pass
+    
+    # Runs in this launcher process, not the server: it only pulls the Tesseract binary
+    # and language data into the OS page cache for the server's first OCR call
+    try:
+        import pytesseract
+        from PIL import Image
+        pytesseract.image_to_data(Image.new("L", (64, 32), 255))
+    except Exception:
+        pass
+
 def main():
     """Main function to run the application"""
+    parser = argparse.ArgumentParser(description="Run the Agentic Document Extraction System")
+    parser.add_argument("--no-prewarm", action="store_true",
+                        help="Skip warming the server and OCR engine after start-up")
+    args = parser.parse_args()
+    
     print("🚀 Starting Agentic Document Extraction System...")
     
     # Check dependencies
@@ -50,13 +134,25 @@ def main():
         print("You can set it in the Streamlit sidebar or add it to .env file")
     
     # Run Streamlit app
+    process = subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", "streamlit_app.py",
+        "--server.port", str(STREAMLIT_PORT)
+    ])
+    
+    if not args.no_prewarm:
+        threading.Thread(target=prewarm, daemon=True).start()
+    
     try:
-        subprocess.run([sys.executable, "-m", "streamlit", "run", "streamlit_app.py"], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Failed to start Streamlit: {e}")
-        sys.exit(1)
+        returncode = process.wait()
     except KeyboardInterrupt:
         print("\n👋 Shutting down...")
+        process.terminate()
+        process.wait()
+        return
+    
+    if returncode != 0:
+        print(f"❌ Failed to start Streamlit: exit code {returncode}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
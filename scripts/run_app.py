@@ -17,23 +17,19 @@ def check_imports():
         'PIL',
         'cv2',
         'pdf2image',
-        'pydantic',
+        'msgspec',
         'numpy'
     ]
     
     missing_modules = []
     
     for module in required_modules:
-        try:
-            if module == 'PIL':
-                import PIL
-            elif module == 'cv2':
-                import cv2
-            else:
-                importlib.import_module(module)
+        # Locate the module without executing it; importing cv2 or streamlit
+        # here would only slow down the check
+        if importlib.util.find_spec(module) is not None:
             print(f"✅ {module}")
-        except ImportError as e:
-            print(f"❌ {module}: {e}")
+        else:
+            print(f"❌ {module}: not installed")
             missing_modules.append(module)
     
     return missing_modules
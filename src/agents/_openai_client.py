@@ -0,0 +1,58 @@
+"""Shared OpenAI client and reply parsing used by all agents."""
+
+import importlib.util
+import os
+import threading
+from typing import Optional, TYPE_CHECKING
+from src.config import settings
+
+try:
+    # Optional: orjson, with the stdlib parser as fallback
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+_client: Optional["AsyncOpenAI"] = None
+_client_api_key: Optional[str] = None
+_http_client: Optional["httpx.AsyncClient"] = None
+_client_lock = threading.Lock()
+
+def get_client() -> "AsyncOpenAI":
+    """
+    Return the process-wide AsyncOpenAI client.
+
+    Every agent shares one HTTP connection pool, so requests reuse keep-alive
+    connections (multiplexed over HTTP/2 when ``h2`` is installed) instead of
+    paying a new TLS handshake per agent. The client is rebuilt when the
+    API key changes; a key set in ``OPENAI_API_KEY`` after startup (as the UI
+    does) takes precedence over the one read at import. The connection pool
+    itself is created once and handed to each rebuilt client, so a key change
+    doesn't leave an unclosed pool behind.
+    """
+    global _client, _client_api_key, _http_client
+    api_key = os.environ.get("OPENAI_API_KEY") or settings.openai_api_key
+    with _client_lock:
+        if _client is None or _client_api_key != api_key:
+            from openai import AsyncOpenAI
+
+            if _http_client is None:
+                import httpx
+
+                _http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(max_keepalive_connections=32),
+                    http2=importlib.util.find_spec("h2") is not None,
+                )
+            _client = AsyncOpenAI(api_key=api_key, http_client=_http_client)
+            _client_api_key = api_key
+        return _client
+
+class SharedClientMixin:
+    """Gives an agent the process-wide client as ``self.client``."""
+    
+    @property
+    def client(self) -> "AsyncOpenAI":
+        return get_client()
@@ -1,33 +1,40 @@
 """Document type detection and routing agent."""
 
-import base64
-from typing import Tuple, Dict, Any
-from openai import OpenAI
-from src.config import settings
+from types import MappingProxyType
+from typing import Tuple, Dict, Any, Optional, Mapping, Pattern
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
-class DocumentRouter:
-    """Agent for detecting document type and routing to appropriate processor."""
-    
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
-        
-    def detect_document_type(self, image_data: bytes) -> Tuple[str, float, Dict[str, Any]]:
-        """
-        Detect document type using GPT-4 Vision.
-        
-        Returns:
-            Tuple of (document_type, confidence, metadata)
-        """
-        try:
-            # Encode image to base64
-            base64_image = base64.b64encode(image_data).decode('utf-8')
-            
-            prompt = """
-            Analyze this document image and determine its type. Look for key visual indicators:
-            
+DOCUMENT_TYPES = ("invoice", "medical_bill", "prescription")
+
+# Structured-output properties for a document type decision
+DETECTION_SCHEMA_PROPERTIES = {
+    "document_type": {"type": "string", "enum": list(DOCUMENT_TYPES)},
+    "confidence": {"type": "number"},
+    "reasoning": {"type": "string", "description": "Brief explanation of key indicators found"},
+    "key_indicators": {"type": "array", "items": {"type": "string"}}
+}
+
+def json_schema_response_format(name: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a strict ``response_format`` whose top-level object has exactly ``properties``."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False
+            }
+        }
+    }
+
+# Visual cues for the fused detect+extract prompt
+DOCUMENT_TYPE_INDICATORS = """
             INVOICE indicators:
             - "Invoice" header or title
             - Invoice number
@@ -53,96 +60,98 @@ class DocumentRouter:
             - Dosage instructions
             - DEA number
             - Pharmacy information
-            
-            Respond with ONLY a JSON object in this exact format:
-            {
-                "document_type": "invoice|medical_bill|prescription",
-                "confidence": 0.95,
-                "reasoning": "Brief explanation of key indicators found",
-                "key_indicators": ["list", "of", "visual", "clues"]
-            }
-            """
-            
-            response = self.client.chat.completions.create(
-                model=settings.openai_model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=500,
-                temperature=0.1
-            )
-            
-            result = response.choices[0].message.content
-            
-            # Parse JSON response
-            import json
-            parsed_result = json.loads(result)
-            
-            doc_type = parsed_result["document_type"]
-            confidence = parsed_result["confidence"]
-            metadata = {
-                "reasoning": parsed_result.get("reasoning", ""),
-                "key_indicators": parsed_result.get("key_indicators", [])
-            }
-            
-            logger.info(f"Document type detected: {doc_type} (confidence: {confidence})")
-            return doc_type, confidence, metadata
-            
-        except Exception as e:
-            logger.error(f"Error in document type detection: {str(e)}")
-            # Fallback to invoice as default
-            return "invoice", 0.3, {"error": str(e)}
+"""
+
+# Extraction schema per document type; shared and immutable, so callers never need to copy it
+_SCHEMAS: Mapping[str, Mapping[str, str]] = MappingProxyType({
+    "invoice": MappingProxyType({
+        "invoice_number": "string",
+        "date": "date (MM/DD/YYYY or DD/MM/YYYY)",
+        "vendor_name": "string",
+        "vendor_address": "string",
+        "customer_name": "string", 
+        "customer_address": "string",
+        "subtotal": "monetary amount",
+        "tax": "monetary amount",
+        "total": "monetary amount",
+        "line_items": "array of {description, quantity, unit_price, total}"
+    }),
+    "medical_bill": MappingProxyType({
+        "patient_name": "string",
+        "patient_id": "string",
+        "date_of_service": "date",
+        "provider_name": "string",
+        "provider_address": "string",
+        "diagnosis_codes": "array of ICD codes",
+        "procedure_codes": "array of CPT codes", 
+        "charges": "monetary amount",
+        "insurance_paid": "monetary amount",
+        "patient_responsibility": "monetary amount"
+    }),
+    "prescription": MappingProxyType({
+        "patient_name": "string",
+        "prescriber_name": "string",
+        "medication_name": "string",
+        "dosage": "string with units",
+        "quantity": "number",
+        "refills": "number",
+        "date_prescribed": "date",
+        "pharmacy_name": "string",
+        "rx_number": "string"
+    })
+})
+
+# OCR text cues per document type, used to classify obvious documents without a vision call
+_TYPE_TEXT_PATTERNS: Dict[str, Tuple[Pattern, ...]] = {
+    doc_type: tuple(re.compile(pattern, re.IGNORECASE) for pattern in patterns)
+    for doc_type, patterns in {
+        "invoice": (
+            r'\binvoice\b', r'\binvoice\s*(?:#|no\.?|number)', r'\bbill\s+to\b', r'\bsub\s*total\b',
+            r'\bpayment\s+terms\b', r'\bdue\s+date\b', r'\bunit\s+price\b', r'\bvendor\b'
+        ),
+        "medical_bill": (
+            r'\bcpt\b', r'\bicd(?:-?\d+)?\b', r'\bdate\s+of\s+service\b', r'\binsurance\b',
+            r'\bclaim\b', r'\bpatient\s+(?:responsibility|balance)\b', r'\b(?:hospital|clinic)\b', r'\bprovider\b'
+        ),
+        "prescription": (
+            r'\brx\b', r'\bprescri(?:ption|ber|bed)\b', r'\bdea\b', r'\brefills?\b',
+            r'\bsig\b', r'\bpharmacy\b', r'\bdispense\b', r'\b\d+\s*mg\b'
+        )
+    }.items()
+}
+
+# How many more cues the winning type needs than the runner-up to skip the vision call
+FAST_CLASSIFY_MARGIN = 3
+
+class DocumentRouter:
+    """Agent for detecting document type and routing to appropriate processor."""
     
-    def get_extraction_schema(self, doc_type: str) -> Dict[str, Any]:
-        """Get the appropriate extraction schema for document type."""
+    def fast_classify(self, ocr_text: str) -> Optional[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Classify a document from its OCR text alone.
         
-        schemas = {
-            "invoice": {
-                "invoice_number": "string",
-                "date": "date (MM/DD/YYYY or DD/MM/YYYY)",
-                "vendor_name": "string",
-                "vendor_address": "string",
-                "customer_name": "string", 
-                "customer_address": "string",
-                "subtotal": "monetary amount",
-                "tax": "monetary amount",
-                "total": "monetary amount",
-                "line_items": "array of {description, quantity, unit_price, total}"
-            },
-            "medical_bill": {
-                "patient_name": "string",
-                "patient_id": "string",
-                "date_of_service": "date",
-                "provider_name": "string",
-                "provider_address": "string",
-                "diagnosis_codes": "array of ICD codes",
-                "procedure_codes": "array of CPT codes", 
-                "charges": "monetary amount",
-                "insurance_paid": "monetary amount",
-                "patient_responsibility": "monetary amount"
-            },
-            "prescription": {
-                "patient_name": "string",
-                "prescriber_name": "string",
-                "medication_name": "string",
-                "dosage": "string with units",
-                "quantity": "number",
-                "refills": "number",
-                "date_prescribed": "date",
-                "pharmacy_name": "string",
-                "rx_number": "string"
-            }
+        Counts the text cues found for each document type and only answers
+        when the best type clearly beats the runner-up.
+        
+        Returns:
+            Tuple of (document_type, confidence, metadata), or None if ambiguous
+        """
+        if not ocr_text:
+            return None
+        
+        scores = {
+            doc_type: sum(1 for pattern in patterns if pattern.search(ocr_text))
+            for doc_type, patterns in _TYPE_TEXT_PATTERNS.items()
         }
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (best_type, best_score), (_, runner_up_score) = ranked[0], ranked[1]
         
-        return schemas.get(doc_type, schemas["invoice"])
+        if best_score - runner_up_score < FAST_CLASSIFY_MARGIN:
+            return None
+        
+        logger.info(f"Document type detected from OCR text: {best_type} (scores: {scores})")
+        return best_type, 0.9, {"mode": "fast", "scores": scores}
+    
+    def get_extraction_schema(self, doc_type: str) -> Mapping[str, str]:
+        """Get the appropriate extraction schema for document type (read-only)."""
+        return _SCHEMAS.get(doc_type, _SCHEMAS["invoice"])
@@ -1,103 +1,382 @@
 """Main extraction agent using LLM for structured data extraction."""
 
-import json
-import base64
-from typing import Dict, List, Any, Optional
-from openai import OpenAI
+import asyncio
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple, Pattern, Mapping, Callable
 from src.config import settings
+from src.agents._openai_client import SharedClientMixin, json_loads
+from src.agents.document_router import (
+    DOCUMENT_TYPE_INDICATORS,
+    DETECTION_SCHEMA_PROPERTIES,
+    json_schema_response_format
+)
+from src.agents.image_encoding import encode_for_vision
+from src.agents.result_cache import content_cached
 from src.models.document_models import ExtractedField, FieldSource, BoundingBox
 import logging
 import re
+import string
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
-class ExtractionAgent:
-    """Agent for structured data extraction using LLM."""
+# (field-name keyword, pattern, confidence if it matches, confidence if it doesn't), checked in
+# order against the field name; the first keyword the name contains decides the score
+_FORMAT_RULES: Tuple[Tuple[str, Pattern, float, float], ...] = tuple(
+    (rule_type, pattern, 0.9, 0.3)
+    for rule_type, pattern in settings.validation_rules.items()
+) + (
+    ("total", re.compile(r'^\$?\d+\.?\d{0,2}$'), 0.8, 0.4),
+)
+
+# Key fields per document type, scored as more relevant
+_RELEVANT_FIELDS: Dict[str, frozenset] = {
+    "invoice": frozenset({"invoice_number", "vendor_name", "total", "date", "customer_name"}),
+    "medical_bill": frozenset({"patient_name", "provider_name", "charges", "date_of_service"}),
+    "prescription": frozenset({"patient_name", "medication_name", "prescriber_name", "dosage"})
+}
+
+@lru_cache(maxsize=4096)
+def _format_confidence(field_name: str, value: str) -> float:
+    """Confidence that ``value`` is well formed for a field called ``field_name``."""
+    field_name = field_name.lower()
+    for keyword, pattern, matched, unmatched in _FORMAT_RULES:
+        if keyword in field_name:
+            return matched if pattern.match(value) else unmatched
+    
+    return 0.6  # Default confidence for text fields
+
+def _fields_json_schema(schema: Mapping[str, str]) -> Dict[str, Any]:
+    """JSON schema for the ``fields`` object of a model reply, one entry per schema field."""
+    return {
+        "type": "object",
+        "properties": {
+            field_name: {
+                "type": "object",
+                "properties": {
+                    "value": {"type": ["string", "null"], "description": description},
+                    "extraction_confidence": {"type": "number"},
+                    "reasoning": {"type": "string"}
+                },
+                "required": ["value", "extraction_confidence", "reasoning"],
+                "additionalProperties": False
+            }
+            for field_name, description in schema.items()
+        },
+        "required": list(schema),
+        "additionalProperties": False
+    }
+
+class _StreamingFieldParser:
+    """
+    Incremental scanner over a streamed JSON reply.
+    
+    Tracks string state and brace depth so each ``"fields": {"name": {...}}``
+    member can be handed to ``on_field`` as soon as its object closes, while
+    the rest of the reply is still being generated.
+    """
     
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+    _DOCUMENT_TYPE = re.compile(r'"document_type"\s*:\s*"([^"\\]*)"')
+    
+    def __init__(self, on_field: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.on_field = on_field
+        self.text = ""
+        self.document_type: Optional[str] = None
+        self._pos = 0
+        self._keys: List[Optional[str]] = []  # Current key at each nesting depth
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = ""
+        self._field_start: Optional[int] = None
+    
+    def feed(self, chunk: str) -> None:
+        """Consume the next piece of the reply, emitting any field objects it completes."""
+        self.text += chunk
+        text = self.text
+        
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i + 1]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ':':
+                self._keys[-1] = json_loads(self._last_string)
+            elif ch in '{[':
+                self._keys.append(None)
+                # Depth 3 object under the top-level "fields" key is one field
+                if ch == '{' and len(self._keys) == 3 and self._keys[0] == "fields":
+                    self._field_start = i
+            elif ch in '}]':
+                if self._field_start is not None and len(self._keys) == 3:
+                    field_data = json_loads(text[self._field_start:i + 1])
+                    self._field_start = None
+                    if self.on_field is not None:
+                        self.on_field(self._keys[1], field_data)
+                self._keys.pop()
+        
+        self._pos = len(text)
+        
+        if self.document_type is None:
+            match = self._DOCUMENT_TYPE.search(text)
+            if match:
+                self.document_type = match.group(1)
+
+class ExtractionAgent(SharedClientMixin):
+    """Agent for structured data extraction using LLM."""
     
-    def extract_structured_data(
+    @content_cached()
+    async def extract_structured_data(
         self, 
         image_data: bytes, 
         ocr_data: Dict[str, Any], 
         doc_type: str,
-        schema: Dict[str, str],
-        custom_fields: Optional[List[str]] = None
+        schema: Mapping[str, str],
+        custom_fields: Optional[List[str]] = None,
+        base64_image: Optional[str] = None
     ) -> List[ExtractedField]:
         """
         Extract structured data using GPT-4 Vision and OCR data.
+        
+        ``base64_image`` lets callers pass an already encoded vision payload
+        so the image is not re-encoded per request. Results are cached by
+        image content, so resubmitting a page does not call the model again.
         """
         try:
-            # Prepare the extraction schema
-            extraction_schema = schema.copy()
-            if custom_fields:
-                for field in custom_fields:
-                    if field not in extraction_schema:
-                        extraction_schema[field] = "string"
+            # Prepare the extraction schema; the shared schema is only copied when extended
+            extraction_schema = self._with_custom_fields(schema, custom_fields)
             
             # Create extraction prompt
             prompt = self._create_extraction_prompt(doc_type, extraction_schema, ocr_data)
             
-            # Encode image
-            base64_image = base64.b64encode(image_data).decode('utf-8')
-            
-            # Call GPT-4 Vision
-            response = self.client.chat.completions.create(
-                model=settings.openai_model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
+            # Encode image off the event loop; only reached on a cache miss
+            if base64_image is None:
+                base64_image = await asyncio.to_thread(encode_for_vision, image_data)
+            
+            # Call GPT-4 Vision, scoring each field while the rest of the reply streams in
+            response_format = json_schema_response_format(
+                "document_extraction", {"fields": _fields_json_schema(extraction_schema)}
+            )
+            streamed: Dict[str, Tuple[str, Optional[ExtractedField]]] = {}
+            
+            def on_field(field_name: str, field_data: Dict[str, Any]) -> None:
+                streamed[field_name] = (doc_type, self._build_field(field_name, field_data, ocr_data, doc_type))
+            
+            extracted_data = await self._call_vision(
+                prompt, base64_image, response_format, _StreamingFieldParser(on_field)
+            )
+            
+            return self._collect_fields(extracted_data, streamed, ocr_data, doc_type)
+            
+        except Exception as e:
+            logger.error(f"Extraction failed: {str(e)}")
+            return []
+    
+    @content_cached(should_cache=lambda result: "error" not in result[2])
+    async def detect_and_extract(
+        self,
+        image_data: bytes,
+        ocr_data: Dict[str, Any],
+        schemas: Mapping[str, Mapping[str, str]],
+        custom_fields: Optional[List[str]] = None,
+        base64_image: Optional[str] = None
+    ) -> Tuple[str, float, Dict[str, Any], List[ExtractedField]]:
+        """
+        Detect document type and extract its fields in a single GPT-4 Vision call.
+        
+        The model is given the schemas for every supported document type and
+        picks one, so the image is uploaded once instead of once per stage.
+        Results are cached by image content like ``extract_structured_data``.
+        
+        Returns:
+            Tuple of (document_type, confidence, metadata, fields)
+        """
+        try:
+            extraction_schemas = {
+                doc_type: self._with_custom_fields(schema, custom_fields)
+                for doc_type, schema in schemas.items()
+            }
+            
+            prompt = self._create_detection_extraction_prompt(extraction_schemas, ocr_data)
+            if base64_image is None:
+                base64_image = await asyncio.to_thread(encode_for_vision, image_data)
+            
+            # One branch per document type, so strict mode only makes the model
+            # write out the chosen type's fields instead of every type's
+            response_format = json_schema_response_format(
+                "document_detection_extraction",
+                {
+                    **DETECTION_SCHEMA_PROPERTIES,
+                    "fields": {
+                        "anyOf": [
+                            _fields_json_schema(extraction_schema)
+                            for extraction_schema in extraction_schemas.values()
                         ]
                     }
-                ],
-                max_tokens=2000,
-                temperature=0.1
+                }
             )
             
-            result = response.choices[0].message.content
-            
-            # Parse the JSON response
-            extracted_data = json.loads(result)
-            
-            # Convert to ExtractedField objects with confidence scoring
-            fields = []
-            for field_name, field_data in extracted_data.get("fields", {}).items():
-                if field_data.get("value"):
-                    # Calculate confidence based on multiple factors
-                    confidence = self._calculate_field_confidence(
-                        field_name, 
-                        field_data, 
-                        ocr_data,
-                        doc_type
-                    )
-                    
-                    # Find source information from OCR data
-                    source = self._find_field_source(field_data.get("value"), ocr_data)
-                    
-                    field = ExtractedField(
-                        name=field_name,
-                        value=field_data["value"],
-                        confidence=confidence,
-                        source=source
+            # document_type precedes fields in the schema, so it is usually known by the
+            # time fields stream in; fields scored against another type are redone below
+            streamed: Dict[str, Tuple[str, Optional[ExtractedField]]] = {}
+            
+            def on_field(field_name: str, field_data: Dict[str, Any]) -> None:
+                streamed_type = parser.document_type
+                if streamed_type in extraction_schemas and field_name in extraction_schemas[streamed_type]:
+                    streamed[field_name] = (
+                        streamed_type,
+                        self._build_field(field_name, field_data, ocr_data, streamed_type)
                     )
-                    fields.append(field)
             
-            return fields
+            parser = _StreamingFieldParser(on_field)
+            extracted_data = await self._call_vision(prompt, base64_image, response_format, parser)
+            
+            doc_type = extracted_data.get("document_type")
+            confidence = extracted_data.get("confidence", 0.5)
+            if doc_type not in extraction_schemas:
+                logger.warning(f"Model returned unknown document type {doc_type!r}, defaulting to invoice")
+                doc_type = "invoice"
+                confidence = min(confidence, 0.3)
+            metadata = {
+                "reasoning": extracted_data.get("reasoning", ""),
+                "key_indicators": extracted_data.get("key_indicators", [])
+            }
+            logger.info(f"Document type detected: {doc_type} (confidence: {confidence})")
+            
+            # Only keep fields that belong to the chosen type's schema
+            allowed_fields = extraction_schemas[doc_type]
+            extracted_data["fields"] = {
+                name: data for name, data in extracted_data.get("fields", {}).items()
+                if name in allowed_fields
+            }
+            
+            fields = self._collect_fields(extracted_data, streamed, ocr_data, doc_type)
+            return doc_type, confidence, metadata, fields
             
         except Exception as e:
-            logger.error(f"Extraction failed: {str(e)}")
-            return []
+            logger.error(f"Detection and extraction failed: {str(e)}")
+            return "invoice", 0.3, {"error": str(e)}, []
     
-    def _create_extraction_prompt(self, doc_type: str, schema: Dict[str, str], ocr_data: Dict[str, Any]) -> str:
+    def _with_custom_fields(
+        self,
+        schema: Mapping[str, str],
+        custom_fields: Optional[List[str]]
+    ) -> Mapping[str, str]:
+        """Return ``schema`` extended with custom fields, copying only if there are any."""
+        if not custom_fields:
+            return schema
+        
+        extraction_schema = dict(schema)
+        for field in custom_fields:
+            if field not in extraction_schema:
+                extraction_schema[field] = "string"
+        return extraction_schema
+    
+    async def _call_vision(
+        self,
+        prompt: str,
+        base64_image: str,
+        response_format: Dict[str, Any],
+        parser: Optional[_StreamingFieldParser] = None
+    ) -> Dict[str, Any]:
+        """
+        Send the prompt and image to GPT-4 Vision and parse the structured JSON reply.
+        
+        The reply is streamed through ``parser`` so completed fields can be
+        processed before the model finishes generating.
+        """
+        if parser is None:
+            parser = _StreamingFieldParser()
+        
+        stream = await self.client.chat.completions.create(
+            model=settings.openai_model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{base64_image}"
+                            }
+                        }
+                    ]
+                }
+            ],
+            max_tokens=2000,
+            temperature=0.1,
+            response_format=response_format,
+            stream=True
+        )
+        
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parser.feed(chunk.choices[0].delta.content)
+        
+        # Structured outputs guarantee schema-valid JSON
+        return json_loads(parser.text)
+    
+    def _collect_fields(
+        self,
+        extracted_data: Dict[str, Any],
+        streamed: Dict[str, Tuple[str, Optional[ExtractedField]]],
+        ocr_data: Dict[str, Any],
+        doc_type: str
+    ) -> List[ExtractedField]:
+        """
+        Gather the fields of a parsed reply, reusing ones already built while streaming.
+        
+        Fields that were missed or scored against a different document type are built now.
+        """
+        fields = []
+        for field_name, field_data in extracted_data.get("fields", {}).items():
+            streamed_type, field = streamed.get(field_name, (None, None))
+            if streamed_type != doc_type:
+                field = self._build_field(field_name, field_data, ocr_data, doc_type)
+            if field is not None:
+                fields.append(field)
+        
+        return fields
+    
+    def _build_field(
+        self,
+        field_name: str,
+        field_data: Dict[str, Any],
+        ocr_data: Dict[str, Any],
+        doc_type: str
+    ) -> Optional[ExtractedField]:
+        """Convert one parsed model field to an ExtractedField with confidence scoring."""
+        if not field_data.get("value"):
+            return None
+        
+        # Calculate confidence based on multiple factors
+        confidence = self._calculate_field_confidence(
+            field_name, 
+            field_data, 
+            ocr_data,
+            doc_type
+        )
+        
+        # Find source information from OCR data
+        source = self._find_field_source(field_data.get("value"), ocr_data)
+        
+        return ExtractedField(
+            name=field_name,
+            value=field_data["value"],
+            confidence=confidence,
+            source=source
+        )
+    
+    def _create_extraction_prompt(self, doc_type: str, schema: Mapping[str, str], ocr_data: Dict[str, Any]) -> str:
         """Create extraction prompt for the LLM."""
         
         ocr_text = ocr_data.get('full_text', '')[:2000]  # Limit OCR text length
@@ -108,27 +387,48 @@ class ExtractionAgent:
         OCR Text (for reference):
         {ocr_text}
         
-        Extract the following fields according to the schema:
-        {json.dumps(schema, indent=2)}
-        
         IMPORTANT INSTRUCTIONS:
         1. Look carefully at both the image and OCR text
         2. For each field, provide the exact value found in the document
         3. If a field is not found or unclear, set value to null
         4. For monetary amounts, include currency symbol if present
         5. For dates, preserve the original format found
-        6. For line items (if applicable), extract as structured array
-        
-        Respond with ONLY a JSON object in this exact format:
-        {{
-            "fields": {{
-                "field_name": {{
-                    "value": "extracted_value_or_null",
-                    "extraction_confidence": 0.95,
-                    "reasoning": "brief explanation of how this was found"
-                }}
-            }}
-        }}
+        6. For line items (if applicable), give the value as a JSON array string
+        
+        Be precise and conservative with confidence scores. Use 0.9+ only for clearly visible, unambiguous text.
+        """
+        
+        return prompt
+    
+    def _create_detection_extraction_prompt(self, schemas: Mapping[str, Mapping[str, str]], ocr_data: Dict[str, Any]) -> str:
+        """Create the combined document type detection and extraction prompt."""
+        
+        ocr_text = ocr_data.get('full_text', '')[:2000]  # Limit OCR text length
+        field_lists = "\n        ".join(
+            f"{doc_type}: {', '.join(schema)}" for doc_type, schema in schemas.items()
+        )
+        
+        prompt = f"""
+        You are an expert document extraction agent. First determine the type of this document,
+        then extract structured data using the schema for that type.
+        
+        Document type indicators:
+        {DOCUMENT_TYPE_INDICATORS}
+        OCR Text (for reference):
+        {ocr_text}
+        
+        Fields by document type:
+        {field_lists}
+        
+        IMPORTANT INSTRUCTIONS:
+        1. Pick exactly one document_type
+        2. Return only the fields of the chosen document type
+        3. Look carefully at both the image and OCR text
+        4. For each field, provide the exact value found in the document
+        5. If a field is not found or unclear, set value to null
+        6. For monetary amounts, include currency symbol if present
+        7. For dates, preserve the original format found
+        8. For line items (if applicable), give the value as a JSON array string
         
         Be precise and conservative with confidence scores. Use 0.9+ only for clearly visible, unambiguous text.
         """
@@ -176,51 +476,27 @@ class ExtractionAgent:
         
         # Find matching words in OCR data
         text_words = text.lower().split()
-        matching_confidences = []
+        if not text_words:
+            return 0.5
         
-        for box in ocr_data['word_boxes']:
-            box_text = box['text'].lower()
-            if any(word in box_text for word in text_words):
-                matching_confidences.append(box['confidence'])
+        # A box matches if it contains any of the words; one alternation scans each box in C
+        lower_texts = self._index_word_boxes(ocr_data)
+        word_pattern = re.compile('|'.join(map(re.escape, text_words)))
+        matches = [i for i, box_text in enumerate(lower_texts) if word_pattern.search(box_text)]
         
-        return sum(matching_confidences) / len(matching_confidences) if matching_confidences else 0.5
+        return float(ocr_data['_conf_arr'][matches].mean()) if matches else 0.5
     
     def _validate_field_format(self, field_name: str, value: str) -> float:
         """Validate field format and return confidence."""
         if not value:
             return 0.0
         
-        # Check against validation rules
-        for rule_type, pattern in settings.validation_rules.items():
-            if rule_type in field_name.lower():
-                if re.match(pattern, value):
-                    return 0.9
-                else:
-                    return 0.3
-        
-        # Basic validation for common field types
-        if 'amount' in field_name.lower() or 'total' in field_name.lower():
-            if re.match(r'^\$?\d+\.?\d{0,2}$', value):
-                return 0.8
-            return 0.4
-        
-        if 'date' in field_name.lower():
-            if re.match(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}', value):
-                return 0.8
-            return 0.4
-        
-        return 0.6  # Default confidence for text fields
+        # Same (field, value) pairs recur across pages and re-runs, so the check is memoized
+        return _format_confidence(field_name, str(value))
     
     def _get_field_relevance(self, field_name: str, doc_type: str) -> float:
         """Get field relevance score based on document type."""
-        relevance_map = {
-            "invoice": ["invoice_number", "vendor_name", "total", "date", "customer_name"],
-            "medical_bill": ["patient_name", "provider_name", "charges", "date_of_service"],
-            "prescription": ["patient_name", "medication_name", "prescriber_name", "dosage"]
-        }
-        
-        relevant_fields = relevance_map.get(doc_type, [])
-        return 0.9 if field_name in relevant_fields else 0.7
+        return 0.9 if field_name in _RELEVANT_FIELDS.get(doc_type, frozenset()) else 0.7
     
     def _find_field_source(self, value: str, ocr_data: Dict[str, Any]) -> Optional[FieldSource]:
         """Find source location of extracted field in OCR data."""
@@ -230,26 +506,81 @@ class ExtractionAgent:
         # Find the best matching word box
         best_match = None
         best_score = 0
+        value_lower = value.lower()
+        word_boxes = ocr_data['word_boxes']
+        lower_texts = self._index_word_boxes(ocr_data)
         
-        for box in ocr_data['word_boxes']:
-            # Simple text matching - could be improved with fuzzy matching
-            if value.lower() in box['text'].lower() or box['text'].lower() in value.lower():
-                score = len(box['text']) / len(value) if len(value) > 0 else 0
-                if score > best_score:
-                    best_score = score
-                    best_match = box
+        # Boxes sharing a token with the value first; if none of them match, the value
+        # may be glued to other text in a box ("Date:01/02/2024"), so scan them all
+        candidates = self._candidate_boxes(value_lower.split(), ocr_data)
+        for indices in (candidates, range(len(lower_texts))):
+            for i in indices:
+                # Simple text matching - could be improved with fuzzy matching
+                box_text = lower_texts[i]
+                if value_lower in box_text or box_text in value_lower:
+                    score = len(box_text) / len(value) if len(value) > 0 else 0
+                    if score > best_score:
+                        best_score = score
+                        best_match = word_boxes[i]
+                        # A box covering the whole value is the answer; stop scanning
+                        if best_score >= 1.0:
+                            break
+            if best_match:
+                break
         
         if best_match:
+            # Structs don't coerce on construction, so pixel ints become floats here
             bbox = BoundingBox(
-                x1=best_match['bbox']['x1'],
-                y1=best_match['bbox']['y1'],
-                x2=best_match['bbox']['x2'],
-                y2=best_match['bbox']['y2']
+                x1=float(best_match['bbox']['x1']),
+                y1=float(best_match['bbox']['y1']),
+                x2=float(best_match['bbox']['x2']),
+                y2=float(best_match['bbox']['y2'])
             )
             return FieldSource(
-                page=1,  # Assuming single page for now
+                page=ocr_data.get('page', 1),
                 bbox=bbox,
                 ocr_confidence=best_match['confidence']
             )
         
         return None
+    
+    def _index_word_boxes(self, ocr_data: Dict[str, Any]) -> List[str]:
+        """
+        Build the per-document lookup structures for OCR word boxes.
+        
+        Stores the lowercased box texts and a token -> box index map in
+        ``ocr_data`` the first time a document is looked up, so every field
+        lookup is a dict hit instead of a scan over all boxes. Returns the
+        lowercased texts.
+        """
+        if '_token_index' in ocr_data:
+            return ocr_data['_lower_texts']
+        
+        word_boxes = ocr_data.get('word_boxes', [])
+        if '_conf_arr' not in ocr_data:
+            ocr_data['_conf_arr'] = np.fromiter(
+                (box['confidence'] for box in word_boxes), dtype=np.float32, count=len(word_boxes)
+            )
+        
+        lower_texts = [box['text'].lower() for box in word_boxes]
+        token_index: Dict[str, List[int]] = {}
+        for i, box_text in enumerate(lower_texts):
+            for token in box_text.split():
+                token_index.setdefault(self._normalize_token(token), []).append(i)
+        
+        ocr_data['_lower_texts'] = lower_texts
+        ocr_data['_token_index'] = token_index
+        return lower_texts
+    
+    def _candidate_boxes(self, tokens: List[str], ocr_data: Dict[str, Any]) -> List[int]:
+        """Return indices of word boxes sharing a token with ``tokens``, in page order."""
+        token_index = ocr_data['_token_index']
+        candidates = set()
+        for token in tokens:
+            candidates.update(token_index.get(self._normalize_token(token), ()))
+        return sorted(candidates)
+    
+    @staticmethod
+    def _normalize_token(token: str) -> str:
+        """Strip surrounding punctuation so "Doe," and "doe" share an index key."""
+        return token.strip(string.punctuation) or token
@@ -0,0 +1,80 @@
+"""Image encoding helpers for vision model requests."""
+
+import io
+import numpy as np
+from PIL import Image
+
+try:
+    # Optional: pybase64, with the stdlib as fallback
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+try:
+    # Optional: libjpeg-turbo codec, with Pillow as fallback
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _turbo_jpeg = None
+
+_JPEG_MAGIC = b'\xff\xd8\xff'
+
+# GPT-4 Vision downsamples anything larger than this, so bigger uploads are wasted bandwidth
+VISION_MAX_SIDE = 2048
+VISION_JPEG_QUALITY = 85
+
+# Anything smaller cannot hold a readable document page
+MIN_IMAGE_BYTES = 2048
+
+def is_valid_image(image_data: bytes) -> bool:
+    """Cheap check that ``image_data`` is a plausible, uncorrupted image, done before any model call."""
+    if len(image_data) <= MIN_IMAGE_BYTES:
+        return False
+
+    try:
+        Image.open(io.BytesIO(image_data)).verify()
+        return True
+    except Exception:
+        return False
+
+def is_jpeg(data: bytes) -> bool:
+    """Whether ``data`` starts with the JPEG magic bytes."""
+    return data[:3] == _JPEG_MAGIC
+
+def encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    """JPEG-encode an RGB image, through libjpeg-turbo when it is installed."""
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(np.asarray(image), quality=quality, pixel_format=TJPF_RGB)
+
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='JPEG', quality=quality)
+    return img_byte_arr.getvalue()
+
+def decode_jpeg(data: bytes) -> Image.Image:
+    """Decode JPEG bytes to an RGB image, through libjpeg-turbo when it is installed."""
+    if _turbo_jpeg is not None:
+        return Image.fromarray(_turbo_jpeg.decode(data, pixel_format=TJPF_RGB))
+
+    image = Image.open(io.BytesIO(data))
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+def encode_for_vision(image_data: bytes) -> str:
+    """
+    Downscale and JPEG-encode image bytes for a vision request.
+
+    Returns:
+        Base64 string ready for a ``data:image/jpeg;base64,`` URL
+    """
+    image = Image.open(io.BytesIO(image_data))
+
+    # Already a JPEG that fits: send it as-is instead of transcoding
+    if image.format == 'JPEG' and max(image.size) <= VISION_MAX_SIDE:
+        payload = image_data
+    else:
+        image.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE), Image.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        payload = encode_jpeg(image, VISION_JPEG_QUALITY)
+
+    return base64.b64encode(payload).decode('ascii')
@@ -0,0 +1,122 @@
+"""Content-addressed cache for model extraction results."""
+
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Mapping, Optional
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Arguments that are derived from the image bytes, so they add nothing to the key
+_DERIVED_ARGS = ("self", "image_data", "ocr_data", "base64_image")
+
+# Entries kept by the in-memory fallback before the least recently used is dropped
+MEMORY_CACHE_MAX_ENTRIES = 256
+
+_cache: Optional[Any] = None
+_cache_lock = threading.Lock()
+
+class _MemoryCache:
+    """
+    Bounded LRU stand-in for ``diskcache.Cache`` when diskcache isn't installed.
+
+    Values are stored pickled, like diskcache does, so every lookup returns
+    fresh objects that callers (e.g. validation) can mutate freely.
+    """
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            data = self._entries[key]
+            self._entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+def get_result_cache() -> Any:
+    """
+    Return the process-wide result cache, opening it on first use.
+
+    Results live in a ``diskcache.Cache`` under ``settings.cache_dir`` so they
+    survive Streamlit reruns and restarts; without diskcache installed a
+    bounded in-memory LRU is used instead.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                import diskcache
+                _cache = diskcache.Cache(settings.cache_dir)
+            except ImportError:
+                logger.warning("diskcache not installed, extraction results are cached in memory only")
+                _cache = _MemoryCache(MEMORY_CACHE_MAX_ENTRIES)
+        return _cache
+
+def _key_part(value: Any) -> Any:
+    """JSON-friendly, order-stable form of an argument for the cache key."""
+    if isinstance(value, Mapping):
+        return sorted((str(k), _key_part(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_key_part(v) for v in value]
+    return value
+
+def content_cached(should_cache: Callable[[Any], bool] = bool):
+    """
+    Memoize an async extraction method by the hash of its image bytes.
+
+    The key combines ``blake2b(image_data)``, the page number, the model and
+    every remaining argument (document type, schemas, custom fields), so a
+    resubmitted page skips the model call entirely. Results rejected by
+    ``should_cache`` (failures) are not stored.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+
+            key_parts = {
+                name: _key_part(value) for name, value in arguments.items()
+                if name not in _DERIVED_ARGS
+            }
+            key_parts["page"] = (arguments.get("ocr_data") or {}).get("page", 1)
+            key_parts["model"] = settings.openai_model
+
+            digest = hashlib.blake2b(arguments["image_data"], digest_size=32)
+            digest.update(func.__qualname__.encode())
+            digest.update(json.dumps(key_parts, sort_keys=True, default=str).encode())
+            key = digest.hexdigest()
+
+            cache = get_result_cache()
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+
+            result = await func(*args, **kwargs)
+            if should_cache(result):
+                cache[key] = result
+            return result
+
+        return wrapper
+
+    return decorator
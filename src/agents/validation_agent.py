@@ -1,18 +1,55 @@
 """Validation agent for quality assurance and cross-field validation."""
 
 import re
-from typing import List, Dict, Any, Tuple
+import numpy as np
+from typing import List, Dict, Any, Tuple, Set
 from src.models.document_models import ExtractedField, QualityAssurance
 from src.config import settings
 import logging
 
+try:
+    # Aho-Corasick automaton: finds every rule keyword in one pass over a field name
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 logger = logging.getLogger(__name__)
 
+# (rule name, field-name keywords that trigger it, validation rule key, failure note)
+_FIELD_FORMAT_RULES: Tuple[Tuple[str, Tuple[str, ...], str, str], ...] = (
+    ('email_format', ('email',), 'email', 'Invalid email format'),
+    ('phone_format', ('phone',), 'phone', 'Invalid phone format'),
+    ('date_format', ('date',), 'date', 'Invalid date format'),
+    ('amount_format', ('amount', 'total', 'price', 'cost', 'charge'), 'amount', 'Invalid amount format')
+)
+
+# Currency symbols, thousands separators and whitespace, stripped in one C-level pass
+_AMOUNT_STRIP = str.maketrans('', '', '$€£¥, \t\n\r')
+
+# Everything but digits, decimal points and signs, for amounts with words or codes in them
+_NON_NUMERIC = re.compile(r'[^\d.-]')
+
 class ValidationAgent:
     """Agent for validating extracted data and performing quality assurance."""
     
     def __init__(self):
         self.validation_rules = settings.validation_rules
+        
+        # Keyword -> validation rule key, matched against field names in a single scan
+        keyword_rules = {
+            keyword: rule_key
+            for _, keywords, rule_key, _ in _FIELD_FORMAT_RULES
+            for keyword in keywords
+        }
+        if ahocorasick is not None:
+            self._keyword_automaton = ahocorasick.Automaton()
+            for keyword, rule_key in keyword_rules.items():
+                self._keyword_automaton.add_word(keyword, rule_key)
+            self._keyword_automaton.make_automaton()
+        else:
+            self._keyword_automaton = None
+            self._keyword_rules = keyword_rules
+            self._keyword_pattern = re.compile('|'.join(map(re.escape, keyword_rules)))
     
     def validate_extraction(self, fields: List[ExtractedField], doc_type: str) -> QualityAssurance:
         """
@@ -21,30 +58,36 @@ class ValidationAgent:
         Returns:
             QualityAssurance object with validation results
         """
-        passed_rules = []
-        failed_rules = []
+        # Distinct rule names for the report; the score counts every individual check
+        passed_rules: Set[str] = set()
+        failed_rules: Set[str] = set()
+        passed_count = 0
+        failed_count = 0
         notes = []
         
-        # Individual field validation
-        for field in fields:
-            field_validation = self._validate_field(field)
+        # Individual field validation, evaluated rule by rule across all fields
+        for field, field_validation in zip(fields, self._validate_fields(fields)):
             field.validation_passed = field_validation['passed']
             field.validation_notes = field_validation['notes']
             
             if field_validation['passed']:
-                passed_rules.extend(field_validation['rules_passed'])
+                passed_rules.update(field_validation['rules_passed'])
+                passed_count += len(field_validation['rules_passed'])
             else:
-                failed_rules.extend(field_validation['rules_failed'])
+                failed_rules.update(field_validation['rules_failed'])
+                failed_count += len(field_validation['rules_failed'])
         
         # Cross-field validation
         cross_validation = self._perform_cross_validation(fields, doc_type)
-        passed_rules.extend(cross_validation['passed'])
-        failed_rules.extend(cross_validation['failed'])
+        passed_rules.update(cross_validation['passed'])
+        failed_rules.update(cross_validation['failed'])
+        passed_count += len(cross_validation['passed'])
+        failed_count += len(cross_validation['failed'])
         notes.extend(cross_validation['notes'])
         
         # Calculate cross-validation score
-        total_validations = len(passed_rules) + len(failed_rules)
-        cross_validation_score = len(passed_rules) / total_validations if total_validations > 0 else 0.0
+        total_validations = passed_count + failed_count
+        cross_validation_score = passed_count / total_validations if total_validations > 0 else 0.0
         
         # Generate summary notes
         low_confidence_fields = [f.name for f in fields if f.confidence < settings.min_field_confidence]
@@ -54,74 +97,84 @@ class ValidationAgent:
         summary_notes = "; ".join(notes) if notes else "All validations passed"
         
         return QualityAssurance(
-            passed_rules=list(set(passed_rules)),
-            failed_rules=list(set(failed_rules)),
+            passed_rules=list(passed_rules),
+            failed_rules=list(failed_rules),
             notes=summary_notes,
             cross_validation_score=cross_validation_score
         )
     
     def _validate_field(self, field: ExtractedField) -> Dict[str, Any]:
         """Validate individual field."""
-        rules_passed = []
-        rules_failed = []
-        notes = []
+        return self._validate_fields([field])[0]
+    
+    def _validate_fields(self, fields: List[ExtractedField]) -> List[Dict[str, Any]]:
+        """
+        Validate fields as columns: one boolean mask per rule over all fields.
         
-        if not field.value:
-            return {
-                'passed': False,
-                'rules_passed': [],
-                'rules_failed': ['empty_value'],
-                'notes': 'Field is empty'
-            }
+        Each format rule's regex runs only over the fields in its bucket, and
+        the confidence check is a single array comparison.
+        """
+        count = len(fields)
+        values = [field.value for field in fields]
+        non_empty = np.fromiter((bool(value) for value in values), dtype=bool, count=count)
+        confidences = np.fromiter((field.confidence for field in fields), dtype=np.float64, count=count)
+        confident = confidences >= settings.min_field_confidence
         
         # Format validation based on field name
-        field_name_lower = field.name.lower()
-        
-        # Email validation
-        if 'email' in field_name_lower:
-            if re.match(self.validation_rules['email'], field.value):
-                rules_passed.append('email_format')
-            else:
-                rules_failed.append('email_format')
-                notes.append('Invalid email format')
+        matched = [self._matched_rules(field.name.lower()) for field in fields]
+        rule_masks = []
+        for rule_name, _, rule_key, failure_note in _FIELD_FORMAT_RULES:
+            applies = non_empty & np.fromiter((rule_key in rules for rules in matched), dtype=bool, count=count)
+            passed = np.zeros(count, dtype=bool)
+            pattern = self.validation_rules[rule_key]
+            for i in np.flatnonzero(applies):
+                passed[i] = pattern.match(values[i]) is not None
+            rule_masks.append((rule_name, failure_note, applies, passed))
         
-        # Phone validation
-        if 'phone' in field_name_lower:
-            if re.match(self.validation_rules['phone'], field.value):
-                rules_passed.append('phone_format')
-            else:
-                rules_failed.append('phone_format')
-                notes.append('Invalid phone format')
-        
-        # Date validation
-        if 'date' in field_name_lower:
-            if re.match(self.validation_rules['date'], field.value):
-                rules_passed.append('date_format')
-            else:
-                rules_failed.append('date_format')
-                notes.append('Invalid date format')
-        
-        # Amount validation
-        if any(keyword in field_name_lower for keyword in ['amount', 'total', 'price', 'cost', 'charge']):
-            if re.match(self.validation_rules['amount'], field.value):
-                rules_passed.append('amount_format')
+        results = []
+        for i in range(count):
+            if not non_empty[i]:
+                results.append({
+                    'passed': False,
+                    'rules_passed': [],
+                    'rules_failed': ['empty_value'],
+                    'notes': 'Field is empty'
+                })
+                continue
+            
+            rules_passed = []
+            rules_failed = []
+            notes = []
+            for rule_name, failure_note, applies, passed in rule_masks:
+                if applies[i]:
+                    if passed[i]:
+                        rules_passed.append(rule_name)
+                    else:
+                        rules_failed.append(rule_name)
+                        notes.append(failure_note)
+            
+            # Confidence validation
+            if confident[i]:
+                rules_passed.append('confidence_threshold')
             else:
-                rules_failed.append('amount_format')
-                notes.append('Invalid amount format')
+                rules_failed.append('confidence_threshold')
+                notes.append(f'Low confidence: {confidences[i]:.2f}')
+            
+            results.append({
+                'passed': len(rules_failed) == 0,
+                'rules_passed': rules_passed,
+                'rules_failed': rules_failed,
+                'notes': '; '.join(notes) if notes else 'Valid'
+            })
         
-        # Confidence validation
-        if field.confidence >= settings.min_field_confidence:
-            rules_passed.append('confidence_threshold')
-        else:
-            rules_failed.append('confidence_threshold')
-            notes.append(f'Low confidence: {field.confidence:.2f}')
+        return results
+    
+    def _matched_rules(self, field_name_lower: str) -> Set[str]:
+        """Validation rule keys whose keywords occur in the field name."""
+        if self._keyword_automaton is not None:
+            return {rule_key for _, rule_key in self._keyword_automaton.iter(field_name_lower)}
         
-        return {
-            'passed': len(rules_failed) == 0,
-            'rules_passed': rules_passed,
-            'rules_failed': rules_failed,
-            'notes': '; '.join(notes) if notes else 'Valid'
-        }
+        return {self._keyword_rules[match.group()] for match in self._keyword_pattern.finditer(field_name_lower)}
     
     def _perform_cross_validation(self, fields: List[ExtractedField], doc_type: str) -> Dict[str, List[str]]:
         """Perform cross-field validation rules."""
@@ -221,5 +274,9 @@ class ValidationAgent:
             return 0.0
         
         # Remove currency symbols and spaces
-        cleaned = re.sub(r'[^\d.-]', '', amount_str)
-        return float(cleaned) if cleaned else 0.0
+        try:
+            return float(amount_str.translate(_AMOUNT_STRIP))
+        except ValueError:
+            # e.g. "USD 1,234.56"; raises ValueError when what's left still isn't a number
+            cleaned = _NON_NUMERIC.sub('', amount_str)
+            return float(cleaned) if cleaned else 0.0
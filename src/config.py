@@ -1,47 +1,53 @@
 """Configuration settings for the document extraction system."""
 
 import os
-from typing import Dict, List
+import re
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping, Pattern, Tuple
+
+# Validation Rules
+_VALIDATION_RULES = {
+    "email": r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$',
+    "phone": r'^\+?[\d\s\-()]{10,}$',
+    "date": r'^\d{1,2}[/-]\d{1,2}[/-]\d{2,4}$',
+    "amount": r'^\$?\d+\.?\d{0,2}$'
+}
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """
+    Application configuration, read from the environment once at import.
+
+    Instances are immutable; the OpenAI key entered in the UI is passed
+    through ``OPENAI_API_KEY`` in the environment instead.
+    """
 
-class Config:
-    """Application configuration."""
-    
     # OpenAI Configuration
-    OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
-    OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4-vision-preview")
-    OPENAI_TEXT_MODEL: str = os.getenv("OPENAI_TEXT_MODEL", "gpt-4-turbo-preview")
-    
+    openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
+    openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4o")
+    openai_text_model: str = os.getenv("OPENAI_TEXT_MODEL", "gpt-4-turbo-preview")
+
     # Document Processing
-    MAX_FILE_SIZE_MB: int = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
-    SUPPORTED_FORMATS: List[str] = [".pdf", ".png", ".jpg", ".jpeg"]
-    
+    max_file_size_mb: int = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
+    max_pdf_pages: int = int(os.getenv("MAX_PDF_PAGES", "20"))
+    cache_dir: str = os.getenv("CACHE_DIR", "/tmp/agentic_cache")
+    supported_formats: Tuple[str, ...] = (".pdf", ".png", ".jpg", ".jpeg")
+
     # OCR Configuration
-    TESSERACT_CONFIG: str = "--oem 3 --psm 6"
-    
+    tesseract_config: str = "--oem 3 --psm 6"
+    denoise_noisy_scans: bool = os.getenv("DENOISE_NOISY_SCANS", "true").lower() == "true"
+
     # Confidence Thresholds
-    MIN_FIELD_CONFIDENCE: float = float(os.getenv("MIN_FIELD_CONFIDENCE", "0.5"))
-    MIN_OVERALL_CONFIDENCE: float = float(os.getenv("MIN_OVERALL_CONFIDENCE", "0.7"))
-    
-    # Validation Rules
-    VALIDATION_RULES: Dict[str, str] = {
-        "email": r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$',
-        "phone": r'^\+?[\d\s\-()]{10,}$',
-        "date": r'^\d{1,2}[/-]\d{1,2}[/-]\d{2,4}$',
-        "amount": r'^\$?\d+\.?\d{0,2}$'
-    }
-
-# Create a settings instance for backward compatibility
-class Settings:
-    def __init__(self):
-        self.openai_api_key = Config.OPENAI_API_KEY
-        self.openai_model = Config.OPENAI_MODEL
-        self.openai_text_model = Config.OPENAI_TEXT_MODEL
-        self.max_file_size_mb = Config.MAX_FILE_SIZE_MB
-        self.supported_formats = Config.SUPPORTED_FORMATS
-        self.tesseract_config = Config.TESSERACT_CONFIG
-        self.min_field_confidence = Config.MIN_FIELD_CONFIDENCE
-        self.min_overall_confidence = Config.MIN_OVERALL_CONFIDENCE
-        self.validation_rules = Config.VALIDATION_RULES
+    min_field_confidence: float = float(os.getenv("MIN_FIELD_CONFIDENCE", "0.5"))
+    min_overall_confidence: float = float(os.getenv("MIN_OVERALL_CONFIDENCE", "0.7"))
+
+    # Validation rules, compiled once
+    validation_rules: Mapping[str, Pattern] = field(
+        default_factory=lambda: MappingProxyType(
+            {rule: re.compile(pattern) for rule, pattern in _VALIDATION_RULES.items()}
+        )
+    )
 
 # Global settings instance
 settings = Settings()
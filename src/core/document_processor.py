@@ -1,19 +1,53 @@
 """Main document processing orchestrator."""
 
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
 import time
-from typing import List, Optional, Dict, Any, Tuple
+from typing import BinaryIO, List, Optional, Dict, Any, Tuple, Coroutine, Mapping, Union
 from PIL import Image
 import io
-import pdf2image
-from src.agents.document_router import DocumentRouter
+import msgspec
+import numpy as np
+from src.config import settings
+from src.agents.document_router import DocumentRouter, DOCUMENT_TYPES
 from src.agents.ocr_processor import OCRProcessor
 from src.agents.extraction_agent import ExtractionAgent
+from src.agents.image_encoding import encode_jpeg, decode_jpeg, is_jpeg, is_valid_image
+from src.agents.result_cache import get_result_cache
 from src.agents.validation_agent import ValidationAgent
 from src.models.document_models import DocumentExtraction, ExtractedField, QualityAssurance
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on concurrent OpenAI requests per document, to stay under rate limits
+MAX_CONCURRENT_REQUESTS = 8
+
+# Tesseract is most accurate around 200 DPI; higher only costs rasterization time
+PDF_RENDER_DPI = 200
+PAGE_JPEG_QUALITY = 85
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def _run_coroutine(coro: Coroutine) -> Any:
+    """
+    Run a coroutine on a long-lived background event loop and wait for it.
+    
+    The async OpenAI client keeps pooled connections bound to the loop that
+    opened them, so every call has to go through the same loop rather than a
+    fresh ``asyncio.run`` per document.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="document-processor-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
 class DocumentProcessor:
     """Main orchestrator for document processing pipeline."""
     
@@ -22,10 +56,13 @@ class DocumentProcessor:
         self.ocr_processor = OCRProcessor()
         self.extraction_agent = ExtractionAgent()
         self.validation_agent = ValidationAgent()
+        
+        # Open the result cache up front so the first document doesn't pay for it
+        get_result_cache()
     
     def process_document(
         self, 
-        file_data: bytes, 
+        file_data: Union[bytes, BinaryIO], 
         filename: str,
         custom_fields: Optional[List[str]] = None
     ) -> DocumentExtraction:
@@ -33,7 +70,7 @@ class DocumentProcessor:
         Process a document through the complete extraction pipeline.
         
         Args:
-            file_data: Raw file bytes
+            file_data: Raw file bytes, or a binary file object positioned at the start
             filename: Original filename
             custom_fields: Optional list of custom fields to extract
             
@@ -44,36 +81,34 @@ class DocumentProcessor:
         
         try:
             # Step 1: Convert to image if PDF
-            image_data, images = self._prepare_images(file_data, filename)
+            page_data, images = self._prepare_images(file_data, filename)
             
             if not images:
                 raise ValueError("Could not process file - no valid images found")
             
-            # Use first page/image for processing
-            primary_image = images[0]
-            
-            # Step 2: Document type detection
-            logger.info("Detecting document type...")
-            doc_type, type_confidence, type_metadata = self.router.detect_document_type(image_data)
-            
-            # Step 3: OCR processing
-            logger.info("Performing OCR...")
-            ocr_data = self.ocr_processor.extract_text_with_boxes(primary_image)
+            # Step 2: OCR processing, pages in parallel
+            logger.info(f"Performing OCR on {len(images)} page(s)...")
+            ocr_pages = self.ocr_processor.extract_text_with_boxes_batch(images)
             
-            # Step 4: Get extraction schema
-            schema = self.router.get_extraction_schema(doc_type)
-            
-            # Step 5: Structured extraction
-            logger.info("Extracting structured data...")
-            extracted_fields = self.extraction_agent.extract_structured_data(
-                image_data, ocr_data, doc_type, schema, custom_fields
+            # Step 3: Document type detection and structured extraction, one call per page
+            logger.info("Detecting document type and extracting structured data...")
+            schemas = {t: self.router.get_extraction_schema(t) for t in DOCUMENT_TYPES}
+            page_results = _run_coroutine(
+                self._extract_pages(page_data, ocr_pages, schemas, custom_fields)
+            )
+            doc_type, type_confidence, type_metadata, extracted_fields = self._merge_page_results(
+                page_results, custom_fields
             )
             
-            # Step 6: Validation and QA
+            # Step 4: Validation and QA
             logger.info("Validating extraction...")
             qa_results = self.validation_agent.validate_extraction(extracted_fields, doc_type)
             
-            # Step 7: Calculate overall confidence
+            # Step 5: Calculate overall confidence
+            word_confidences = np.concatenate([page['_conf_arr'] for page in ocr_pages])
+            ocr_data = {
+                'average_confidence': float(word_confidences.mean()) if word_confidences.size else 0.0
+            }
             overall_confidence = self._calculate_overall_confidence(
                 extracted_fields, type_confidence, ocr_data, qa_results
             )
@@ -90,11 +125,15 @@ class DocumentProcessor:
                 metadata={
                     'filename': filename,
                     'type_detection': type_metadata,
-                    'ocr_confidence': ocr_data.get('average_confidence', 0.0),
+                    'ocr_confidence': ocr_data['average_confidence'],
                     'num_pages': len(images)
                 }
             )
             
+            # Structs are not validated on construction, so the assembled result is checked
+            # against the model types (doc_type literal, confidence bounds) here
+            result = msgspec.convert(msgspec.to_builtins(result), type=DocumentExtraction)
+            
             logger.info(f"Document processing completed in {processing_time:.2f}s")
             return result
             
@@ -113,37 +152,125 @@ class DocumentProcessor:
                 metadata={'error': str(e), 'filename': filename}
             )
     
-    def _prepare_images(self, file_data: bytes, filename: str) -> Tuple[bytes, List[Image.Image]]:
-        """Convert file to images for processing."""
+    async def _extract_pages(
+        self,
+        page_data: List[bytes],
+        ocr_pages: List[Dict[str, Any]],
+        schemas: Mapping[str, Mapping[str, str]],
+        custom_fields: Optional[List[str]]
+    ) -> List[Tuple[str, float, Dict[str, Any], List[ExtractedField]]]:
+        """Run detection and extraction for all pages concurrently."""
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        
+        async def extract_page(image_data: bytes, ocr_data: Dict[str, Any]):
+            # Tiny or corrupt pages are rejected without paying for a vision call
+            if not is_valid_image(image_data):
+                logger.warning("Skipping detection and extraction for an invalid image")
+                return "invoice", 0.0, {"error": "invalid_image"}, []
+            
+            # Obvious documents are typed from OCR text, so only extraction needs the model
+            fast_result = self.router.fast_classify(ocr_data.get('full_text', ''))
+            
+            async with semaphore:
+                if fast_result is not None:
+                    doc_type, type_confidence, type_metadata = fast_result
+                    fields = await self.extraction_agent.extract_structured_data(
+                        image_data, ocr_data, doc_type, schemas[doc_type], custom_fields
+                    )
+                    return doc_type, type_confidence, type_metadata, fields
+                
+                return await self.extraction_agent.detect_and_extract(
+                    image_data, ocr_data, schemas, custom_fields
+                )
+        
+        return await asyncio.gather(
+            *(extract_page(image_data, ocr_data) for image_data, ocr_data in zip(page_data, ocr_pages))
+        )
+    
+    def _merge_page_results(
+        self,
+        page_results: List[Tuple[str, float, Dict[str, Any], List[ExtractedField]]],
+        custom_fields: Optional[List[str]]
+    ) -> Tuple[str, float, Dict[str, Any], List[ExtractedField]]:
+        """Combine per-page results, keeping the most confident value for each field."""
+        # The most confidently classified page decides the document type
+        doc_type, type_confidence, type_metadata, _ = max(page_results, key=lambda r: r[1])
+        
+        schema = self.router.get_extraction_schema(doc_type)
+        allowed_fields = set(schema) | set(custom_fields or [])
+        
+        best_fields: Dict[str, ExtractedField] = {}
+        for _, _, _, fields in page_results:
+            for field in fields:
+                if field.name not in allowed_fields:
+                    continue
+                current = best_fields.get(field.name)
+                if current is None or field.confidence > current.confidence:
+                    best_fields[field.name] = field
+        
+        return doc_type, type_confidence, type_metadata, list(best_fields.values())
+    
+    def _prepare_images(
+        self,
+        file_data: Union[bytes, BinaryIO],
+        filename: str
+    ) -> Tuple[List[bytes], List[Image.Image]]:
+        """Convert file to page images plus the JPEG bytes of each page for API calls."""
         try:
             if filename.lower().endswith('.pdf'):
-                # Convert PDF to images
-                images = pdf2image.convert_from_bytes(file_data, dpi=300)
-                
-                # Convert first page back to bytes for API calls
-                img_byte_arr = io.BytesIO()
-                images[0].save(img_byte_arr, format='JPEG', quality=95)
-                image_data = img_byte_arr.getvalue()
+                import pdf2image
                 
-                return image_data, images
-            else:
-                # Handle image files
-                image = Image.open(io.BytesIO(file_data))
+                # Rasterize straight to JPEG files so each page's bytes are reused, not re-encoded
+                with tempfile.TemporaryDirectory() as output_folder:
+                    # poppler reads from a path, so uploads are streamed to disk rather than buffered
+                    pdf_path = os.path.join(output_folder, 'document.pdf')
+                    with open(pdf_path, 'wb') as pdf_file:
+                        if isinstance(file_data, (bytes, bytearray, memoryview)):
+                            pdf_file.write(file_data)
+                        else:
+                            shutil.copyfileobj(file_data, pdf_file)
+                    
+                    page_paths = pdf2image.convert_from_path(
+                        pdf_path,
+                        dpi=PDF_RENDER_DPI,
+                        fmt='jpeg',
+                        jpegopt={'quality': PAGE_JPEG_QUALITY, 'progressive': False, 'optimize': False},
+                        last_page=settings.max_pdf_pages,
+                        thread_count=os.cpu_count() or 1,
+                        output_folder=output_folder,
+                        paths_only=True
+                    )
+                    page_data = []
+                    for page_path in page_paths:
+                        with open(page_path, 'rb') as page_file:
+                            page_data.append(page_file.read())
                 
-                # Convert to RGB if necessary
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                # Convert to bytes
-                img_byte_arr = io.BytesIO()
-                image.save(img_byte_arr, format='JPEG', quality=95)
-                image_data = img_byte_arr.getvalue()
-                
-                return image_data, [image]
+                images = [Image.open(io.BytesIO(data)) for data in page_data]
+                return page_data, images
+            
+            if isinstance(file_data, (bytes, bytearray, memoryview)):
+                file_data = io.BytesIO(file_data)
+            
+            # JPEG uploads are sent as they are; only decoded for OCR
+            header = file_data.read(3)
+            file_data.seek(0)
+            if is_jpeg(header):
+                jpeg_data = file_data.read()
+                return [jpeg_data], [decode_jpeg(jpeg_data)]
+            
+            # Handle other image files, decoded straight from the stream
+            image = Image.open(file_data)
+            
+            # Convert to RGB if necessary
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            
+            # Convert page to bytes for API calls
+            return [encode_jpeg(image, PAGE_JPEG_QUALITY)], [image]
                 
         except Exception as e:
             logger.error(f"Image preparation failed: {str(e)}")
-            return b'', []
+            return [], []
     
     def _calculate_overall_confidence(
         self, 
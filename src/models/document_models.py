@@ -1,48 +1,52 @@
-"""Pydantic models for document extraction."""
+"""msgspec models for document extraction."""
 
-from typing import List, Optional, Dict, Any, Literal
-from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Literal, Annotated
+import msgspec
 
-class BoundingBox(BaseModel):
+# A score in [0, 1]; Structs only enforce it when decoded or converted with msgspec, which
+# DocumentProcessor does for every result it assembles
+Confidence = Annotated[float, msgspec.Meta(ge=0.0, le=1.0)]
+
+class BoundingBox(msgspec.Struct, kw_only=True):
     """Bounding box coordinates."""
     x1: float
     y1: float
     x2: float
     y2: float
 
-class FieldSource(BaseModel):
+class FieldSource(msgspec.Struct, kw_only=True):
     """Source information for extracted field."""
     page: int
     bbox: Optional[BoundingBox] = None
     ocr_confidence: Optional[float] = None
 
-class ExtractedField(BaseModel):
+class ExtractedField(msgspec.Struct, kw_only=True):
     """Individual extracted field with confidence."""
     name: str
     value: str
-    confidence: float = Field(ge=0.0, le=1.0)
+    confidence: Confidence
     source: Optional[FieldSource] = None
     validation_passed: bool = True
     validation_notes: Optional[str] = None
 
-class QualityAssurance(BaseModel):
+class QualityAssurance(msgspec.Struct, kw_only=True):
     """Quality assurance results."""
     passed_rules: List[str] = []
     failed_rules: List[str] = []
     notes: str = ""
     cross_validation_score: float = 0.0
 
-class DocumentExtraction(BaseModel):
+class DocumentExtraction(msgspec.Struct, kw_only=True):
     """Complete document extraction result."""
     doc_type: Literal["invoice", "medical_bill", "prescription"]
     fields: List[ExtractedField]
-    overall_confidence: float = Field(ge=0.0, le=1.0)
+    overall_confidence: Confidence
     qa: QualityAssurance
     processing_time: Optional[float] = None
     metadata: Dict[str, Any] = {}
 
 # Document type specific schemas
-class InvoiceFields(BaseModel):
+class InvoiceFields(msgspec.Struct, kw_only=True):
     """Standard invoice fields."""
     invoice_number: Optional[str] = None
     date: Optional[str] = None
@@ -55,7 +59,7 @@ class InvoiceFields(BaseModel):
     total: Optional[str] = None
     line_items: Optional[List[Dict[str, str]]] = None
 
-class MedicalBillFields(BaseModel):
+class MedicalBillFields(msgspec.Struct, kw_only=True):
     """Standard medical bill fields."""
     patient_name: Optional[str] = None
     patient_id: Optional[str] = None
@@ -68,7 +72,7 @@ class MedicalBillFields(BaseModel):
     insurance_paid: Optional[str] = None
     patient_responsibility: Optional[str] = None
 
-class PrescriptionFields(BaseModel):
+class PrescriptionFields(msgspec.Struct, kw_only=True):
     """Standard prescription fields."""
     patient_name: Optional[str] = None
     prescriber_name: Optional[str] = None
@@ -1,27 +1,43 @@
 """Streamlit UI for the document extraction system."""
 
 import streamlit as st
+import bisect
+import re
+import hashlib
+import html
 import json
+import os
+import msgspec
+import threading
 import time
-from typing import Optional
-from src.core.document_processor import DocumentProcessor
-from src.config import settings
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, TYPE_CHECKING
+from src.models.document_models import DocumentExtraction
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+try:
+    # Optional: orjson, with the stdlib encoder as fallback
+    import orjson
+except ImportError:
+    orjson = None
+
+if TYPE_CHECKING:
+    from src.core.document_processor import DocumentProcessor
 
-# Page configuration
-st.set_page_config(
-    page_title="Agentic Document Extraction",
-    page_icon="📄",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+@st.cache_resource(show_spinner=False)
+def _bootstrap() -> None:
+    """One-time process setup; cached so script reruns skip it."""
+    # Configure logging
+    logging.basicConfig(level=logging.INFO)
+
+_bootstrap()
+logger = logging.getLogger(__name__)
 
-# Custom CSS
-st.markdown("""
+# Custom CSS, whitespace-collapsed to shrink the payload. It has to be emitted on every
+# rerun: Streamlit drops elements a rerun doesn't send, so a send-once guard loses the styles.
+_CSS = re.sub(r"\s+", " ", """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -61,46 +77,311 @@ st.markdown("""
         font-weight: bold;
     }
 </style>
-""", unsafe_allow_html=True)
+""").strip()
+
+@st.cache_resource
+def get_processor() -> "DocumentProcessor":
+    """
+    Build the document processor once per server process.
+
+    Streamlit reruns the script on every interaction; caching the processor
+    keeps its OCR engine and thread pool alive across reruns and sessions.
+    The OpenAI client reads ``OPENAI_API_KEY`` on each call, so a key
+    entered later in the sidebar needs no rebuild. The processor module
+    (OpenAI SDK, OpenCV, OCR) is imported here, on first use, to keep the
+    app's cold start light.
+    """
+    from src.core.document_processor import DocumentProcessor
+    return DocumentProcessor()
+
+# Documents extracted at once across all sessions
+EXTRACTION_WORKERS = 4
+
+# Seconds between checks on a running extraction
+POLL_INTERVAL = 0.5
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Worker threads that run extractions off the script thread, shared by all sessions."""
+    return ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS, thread_name_prefix="extraction")
+
+# Extraction results are reused for a day
+RESULT_CACHE_TTL = 24 * 60 * 60
+
+class _FailedExtraction(Exception):
+    """Carries an error result out of ``_extract`` so Streamlit does not memoize it."""
+    
+    def __init__(self, result: DocumentExtraction):
+        super().__init__(result.qa.notes)
+        self.result = result
+
+def _is_failed(result: DocumentExtraction) -> bool:
+    """
+    Whether a result reflects a failure that a retry could fix.
+    
+    Agents catch API errors (bad key, rate limit, network) themselves: detection
+    failures surface under ``type_detection`` and extraction failures as an
+    empty field list, so a result without fields is never treated as final.
+    """
+    return (
+        'error' in result.metadata
+        or 'error' in result.metadata.get('type_detection', {})
+        or not result.fields
+    )
+
+@st.cache_data(show_spinner=False, ttl=RESULT_CACHE_TTL)
+def _extract(file_hash: str, filename: str, custom_fields: Tuple[str, ...]) -> DocumentExtraction:
+    """
+    Run the extraction for an uploaded file, memoized on its content hash.
+
+    The upload is read from ``st.session_state`` rather than passed in,
+    so Streamlit hashes a short digest instead of the whole file.
+    """
+    upload = st.session_state.uploaded_files[file_hash]
+    upload.seek(0)
+    result = get_processor().process_document(upload, filename, list(custom_fields) or None)
+    
+    if _is_failed(result):
+        raise _FailedExtraction(result)
+    return result
+
+def upload_digest(upload: BinaryIO) -> str:
+    """
+    Content hash of an upload, computed once per uploaded file.
+    
+    Digests are remembered by Streamlit's ``file_id``, so clicking Process
+    again on the same upload doesn't rehash it.
+    """
+    digests = st.session_state.setdefault('upload_digests', {})
+    file_id = getattr(upload, 'file_id', None)
+    
+    if file_id is None or file_id not in digests:
+        with upload.getbuffer() as view:
+            digest = hashlib.blake2b(view, digest_size=16).hexdigest()
+        if file_id is None:
+            return digest
+        # Only the current upload is remembered
+        digests.clear()
+        digests[file_id] = digest
+    return digests[file_id]
+
+def submit_extraction(upload: BinaryIO, filename: str, custom_fields: Optional[List[str]]) -> Future:
+    """
+    Start extracting an uploaded file on a worker thread.
+    
+    ``upload`` is Streamlit's in-memory ``UploadedFile``; it is hashed through
+    its buffer and handed to the processor as a stream, never copied to bytes.
+    An earlier identical request resolves from the cache without a model call.
+    
+    Returns:
+        Future resolving to the DocumentExtraction
+    """
+    file_hash = upload_digest(upload)
+    
+    # Only the current upload is kept; a cache miss always follows this assignment
+    st.session_state.uploaded_files = {file_hash: upload}
+    
+    fields_key = tuple(sorted(custom_fields or ()))
+    ctx = get_script_run_ctx()
+    
+    def run() -> DocumentExtraction:
+        # The worker needs this session's context for st.session_state and st.cache_data
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            return _extract(file_hash, filename, fields_key)
+        except _FailedExtraction as e:
+            return e.result
+    
+    return get_executor().submit(run)
+
+@st.fragment(run_every=POLL_INTERVAL)
+def poll_extraction() -> None:
+    """Show progress of the running extraction and rerun the app once it has finished."""
+    future = st.session_state.extraction_future
+    
+    if not future.done():
+        st.info("⏳ Processing document... This may take a few moments.")
+        return
+    
+    del st.session_state.extraction_future
+    try:
+        st.session_state.extraction_result = future.result()
+        st.session_state.extraction_result_id = uuid.uuid4().hex
+    except Exception as e:
+        st.session_state.extraction_error = str(e)
+        logger.error(f"Processing error: {str(e)}")
+    
+    st.rerun()
+
+# Lower bounds of the medium and high confidence bands, and the red/yellow/green for each band
+_BAND_THRESHOLDS = (0.6, 0.8)
+_BAND_COLORS = ("#dc3545", "#ffc107", "#28a745")
 
 def get_confidence_color(confidence: float) -> str:
     """Get color based on confidence score."""
-    if confidence >= 0.8:
-        return "#28a745"  # Green
-    elif confidence >= 0.6:
-        return "#ffc107"  # Yellow
-    else:
-        return "#dc3545"  # Red
+    return _BAND_COLORS[bisect.bisect_right(_BAND_THRESHOLDS, confidence)]
 
-def render_confidence_bar(confidence: float, label: str = "") -> None:
-    """Render a confidence bar."""
+def get_result_dump(result_id: str, result: DocumentExtraction) -> Dict[str, Any]:
+    """Builtin (JSON-ready) form of a result, converted once per ``result_id`` and kept in session state."""
+    cached = st.session_state.get('result_dump')
+    if cached is None or cached[0] != result_id:
+        cached = (result_id, msgspec.to_builtins(result))
+        st.session_state.result_dump = cached
+    return cached[1]
+
+@st.cache_data(max_entries=16)
+def serialize_result(result_id: str, _result_dump: Dict[str, Any]) -> str:
+    """
+    Pretty-printed JSON for a result, computed once per ``result_id``.
+    
+    The dump itself is left unhashed; ``result_id`` changes whenever a new
+    result is stored, so widget reruns reuse the string.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            _result_dump, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+        ).decode()
+    return json.dumps(_result_dump, indent=2, default=str)
+
+def confidence_bar_html(confidence: float, label: str = "") -> str:
+    """HTML for a confidence bar."""
     color = get_confidence_color(confidence)
     width = confidence * 100
     
-    st.markdown(f"""
-    <div class="confidence-bar">
-        <div class="confidence-fill" style="background-color: {color}; width: {width}%;">
-            {label} {confidence:.2f}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    return (
+        f'<div class="confidence-bar">'
+        f'<div class="confidence-fill" style="background-color: {color}; width: {width}%;">'
+        f'{label} {confidence:.2f}</div></div>'
+    )
 
-def render_extracted_field(field) -> None:
-    """Render an extracted field with confidence."""
-    st.markdown(f"""
-    <div class="field-container">
-        <strong>{field.name}:</strong> {field.value}
-    </div>
-    """, unsafe_allow_html=True)
-    
-    render_confidence_bar(field.confidence, "Confidence:")
+def render_confidence_bar(confidence: float, label: str = "") -> None:
+    """Render a confidence bar."""
+    st.markdown(confidence_bar_html(confidence, label), unsafe_allow_html=True)
+
+def extracted_field_html(field) -> str:
+    """HTML for an extracted field with its confidence bar and validation notes."""
+    parts = [
+        f'<div class="field-container"><strong>{html.escape(field.name)}:</strong> '
+        f'{html.escape(str(field.value))}</div>',
+        confidence_bar_html(field.confidence, "Confidence:"),
+    ]
     
     if field.validation_notes and field.validation_notes != "Valid":
-        st.caption(f"⚠️ {field.validation_notes}")
+        parts.append(f'<small>⚠️ {html.escape(field.validation_notes)}</small>')
+    
+    return "".join(parts)
+
+def render_extracted_fields(fields) -> None:
+    """Render every extracted field in a single markdown element."""
+    st.markdown("".join(extracted_field_html(field) for field in fields), unsafe_allow_html=True)
+
+def render_rules(rules, css_class: str, icon: str) -> None:
+    """Render a list of QA rules in a single markdown element."""
+    st.markdown(
+        "<br>".join(f'<span class="{css_class}">{icon} {html.escape(rule)}</span>' for rule in rules),
+        unsafe_allow_html=True
+    )
+
+@st.fragment
+def render_results() -> None:
+    """
+    Render the stored extraction result.
+    
+    Runs as a fragment, so its own widgets (debug toggle, download) rerun
+    only this section rather than the whole page.
+    """
+    if 'extraction_result' not in st.session_state:
+        return
+    
+    result = st.session_state.extraction_result
+    
+    st.markdown("---")
+    st.subheader("📊 Extraction Results")
+    
+    # Overall metrics
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Document Type", result.doc_type.replace('_', ' ').title())
+    
+    with col2:
+        st.metric("Fields Extracted", len(result.fields))
+    
+    with col3:
+        st.metric("Processing Time", f"{result.processing_time:.2f}s")
+    
+    with col4:
+        st.metric("Overall Confidence", f"{result.overall_confidence:.2f}")
+    
+    # Overall confidence bar
+    st.subheader("🎯 Overall Confidence")
+    render_confidence_bar(result.overall_confidence, "Overall:")
+    
+    # Extracted fields
+    if result.fields:
+        st.subheader("📋 Extracted Fields")
+        render_extracted_fields(result.fields)
+    
+    # Quality Assurance
+    st.subheader("✅ Quality Assurance")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if result.qa.passed_rules:
+            st.markdown("**Passed Rules:**")
+            render_rules(result.qa.passed_rules, "qa-passed", "✅")
+    
+    with col2:
+        if result.qa.failed_rules:
+            st.markdown("**Failed Rules:**")
+            render_rules(result.qa.failed_rules, "qa-failed", "❌")
+    
+    if result.qa.notes:
+        st.info(f"**Notes:** {result.qa.notes}")
+    
+    # JSON Output
+    st.subheader("📄 JSON Output")
+    
+    # Convert result to JSON, once per result
+    result_id = st.session_state.setdefault('extraction_result_id', uuid.uuid4().hex)
+    result_dump = get_result_dump(result_id, result)
+    json_str = serialize_result(result_id, result_dump)
+    
+    # Collapsible tree; given the cached string, st.json skips re-serializing on each rerun
+    st.json(json_str, expanded=False)
+    
+    # Download button
+    st.download_button(
+        label="📥 Download JSON",
+        data=json_str,
+        file_name=f"extraction_result_{int(time.time())}.json",
+        mime="application/json"
+    )
+    
+    # Debug information; toggling it reruns only this fragment
+    if st.checkbox("Show debug information", value=False, key="show_debug"):
+        st.subheader("🔍 Debug Information")
+        st.json(result_dump['metadata'])
 
 def main():
     """Main Streamlit application."""
     
+    # Page configuration; set on every run, since entry points that import this
+    # module only execute its top level once per process
+    st.set_page_config(
+        page_title="Agentic Document Extraction",
+        page_icon="📄",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    st.markdown(_CSS, unsafe_allow_html=True)
+    
+    # run.py's start-up session asks for the processor to be built before the first user needs it
+    if st.query_params.get("prewarm"):
+        get_processor()
+    
     # Header
     st.markdown('<h1 class="main-header">🤖 Agentic Document Extraction</h1>', unsafe_allow_html=True)
     
@@ -113,30 +394,29 @@ def main():
     with st.sidebar:
         st.header("⚙️ Configuration")
         
-        # API Key input
-        api_key = st.text_input(
-            "OpenAI API Key", 
-            type="password",
-            help="Enter your OpenAI API key for document processing"
-        )
+        # Inputs are committed together on Apply, so typing doesn't rerun the app
+        with st.form("config"):
+            # API Key input
+            api_key = st.text_input(
+                "OpenAI API Key", 
+                type="password",
+                help="Enter your OpenAI API key for document processing"
+            )
+            
+            # Custom fields
+            st.subheader("Custom Fields (Optional)")
+            custom_fields_text = st.text_area(
+                "Additional fields to extract",
+                placeholder="Enter field names, one per line\ne.g.:\ncompany_phone\nspecial_instructions",
+                help="Specify additional fields you want to extract from the document"
+            )
+            
+            st.form_submit_button("Apply")
         
         if api_key:
-            settings.openai_api_key = api_key
-        
-        # Custom fields
-        st.subheader("Custom Fields (Optional)")
-        custom_fields_text = st.text_area(
-            "Additional fields to extract",
-            placeholder="Enter field names, one per line\ne.g.:\ncompany_phone\nspecial_instructions",
-            help="Specify additional fields you want to extract from the document"
-        )
+            os.environ["OPENAI_API_KEY"] = api_key
         
         custom_fields = [field.strip() for field in custom_fields_text.split('\n') if field.strip()] if custom_fields_text else None
-        
-        # Processing options
-        st.subheader("Processing Options")
-        show_debug = st.checkbox("Show debug information", value=False)
-        auto_download = st.checkbox("Auto-download JSON results", value=False)
     
     # Main content area
     col1, col2 = st.columns([1, 1])
@@ -163,110 +443,32 @@ def main():
     with col2:
         st.subheader("🎯 Extraction Results")
         
-        if uploaded_file is not None and settings.openai_api_key:
+        if uploaded_file is not None and os.environ.get("OPENAI_API_KEY"):
             
             if st.button("🚀 Process Document", type="primary"):
-                
-                with st.spinner("Processing document... This may take a few moments."):
-                    try:
-                        # Initialize processor
-                        processor = DocumentProcessor()
-                        
-                        # Process document
-                        file_data = uploaded_file.read()
-                        result = processor.process_document(
-                            file_data, 
-                            uploaded_file.name,
-                            custom_fields
-                        )
-                        
-                        # Store result in session state
-                        st.session_state.extraction_result = result
-                        
-                    except Exception as e:
-                        st.error(f"Processing failed: {str(e)}")
-                        logger.error(f"Processing error: {str(e)}")
+                # Runs in the background; the page stays responsive meanwhile
+                st.session_state.pop('extraction_error', None)
+                st.session_state.extraction_future = submit_extraction(
+                    uploaded_file, 
+                    uploaded_file.name,
+                    custom_fields
+                )
         
-        elif not settings.openai_api_key:
+        elif not os.environ.get("OPENAI_API_KEY"):
             st.warning("⚠️ Please enter your OpenAI API key in the sidebar to process documents.")
         
         elif uploaded_file is None:
             st.info("👆 Upload a document to get started.")
-    
-    # Display results if available
-    if hasattr(st.session_state, 'extraction_result'):
-        result = st.session_state.extraction_result
-        
-        st.markdown("---")
-        st.subheader("📊 Extraction Results")
-        
-        # Overall metrics
-        col1, col2, col3, col4 = st.columns(4)
         
-        with col1:
-            st.metric("Document Type", result.doc_type.replace('_', ' ').title())
-        
-        with col2:
-            st.metric("Fields Extracted", len(result.fields))
-        
-        with col3:
-            st.metric("Processing Time", f"{result.processing_time:.2f}s")
-        
-        with col4:
-            st.metric("Overall Confidence", f"{result.overall_confidence:.2f}")
-        
-        # Overall confidence bar
-        st.subheader("🎯 Overall Confidence")
-        render_confidence_bar(result.overall_confidence, "Overall:")
-        
-        # Extracted fields
-        if result.fields:
-            st.subheader("📋 Extracted Fields")
-            
-            for field in result.fields:
-                render_extracted_field(field)
+        # Polled independently of the uploader, so a new upload doesn't orphan the run
+        if 'extraction_future' in st.session_state:
+            poll_extraction()
         
-        # Quality Assurance
-        st.subheader("✅ Quality Assurance")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if result.qa.passed_rules:
-                st.markdown("**Passed Rules:**")
-                for rule in result.qa.passed_rules:
-                    st.markdown(f'<span class="qa-passed">✅ {rule}</span>', unsafe_allow_html=True)
-        
-        with col2:
-            if result.qa.failed_rules:
-                st.markdown("**Failed Rules:**")
-                for rule in result.qa.failed_rules:
-                    st.markdown(f'<span class="qa-failed">❌ {rule}</span>', unsafe_allow_html=True)
-        
-        if result.qa.notes:
-            st.info(f"**Notes:** {result.qa.notes}")
-        
-        # JSON Output
-        st.subheader("📄 JSON Output")
-        
-        # Convert result to JSON
-        result_dict = result.dict()
-        json_str = json.dumps(result_dict, indent=2, default=str)
-        
-        st.code(json_str, language='json')
-        
-        # Download button
-        st.download_button(
-            label="📥 Download JSON",
-            data=json_str,
-            file_name=f"extraction_result_{int(time.time())}.json",
-            mime="application/json"
-        )
-        
-        # Debug information
-        if show_debug:
-            st.subheader("🔍 Debug Information")
-            st.json(result.metadata)
+        if 'extraction_error' in st.session_state:
+            st.error(f"Processing failed: {st.session_state.extraction_error}")
+    
+    # Display results if available
+    render_results()
 
 if __name__ == "__main__":
     main()